@@ -13,6 +13,9 @@ import nltk
 from colorama import init, Fore, Back, Style
 from corpus import clean_corpus, lemmatize_corpus, Corpus
 from syntax import agency_parse, analyze_agency
+from tasks import Worker
+import profiling
+from profiling import timed
 
 #Porter function for stemming, although this is now legacy
 porter = nltk.PorterStemmer()
@@ -38,18 +41,34 @@ Possible commands are listed below. [square brackets] are command names,
 
 Commands:  
     *[conc]ordance |word OR index| (additional words) (character span width)
-    *[coll]ocation |word| (second word) (window) (min ngram frequency) (min collocation score)
+    *[coll]ocation |word| (second word) (window) (min ngram frequency) (min collocation score) (approx OR strat)
     *[parse] |word| (second word)
+    *[freq]uency list (number of words)
+    *[ngrams] list |ngram length| (number of ngrams) (approx)
     *[switch] corpora
     *[list] corpora
     *[settings]
-    *[save] last output as text file in current directory""")
+    *[save] last output as text file in current directory
+    *[jobs] list running and queued commands
+    *[cancel] running command (all to also clear queued commands)
+    *[stats] of last command (all for session totals) (export |filename|) (profile next command) (reset)
+
+Searches run in the background, so further commands can be queued while one is running. 
+Ctrl-C cancels the running command and returns to the prompt.""")
         #Default concordance and collocation settings
         self.conc_width = 50
         self.coll_win = 5
         self.coll_min_freq = 20
         self.coll_min_score = 0
+        #Approximate collocation time limit (seconds), precision (percent), and strata for the strat option
+        self.coll_time = 10
+        self.coll_precision = 10
+        self.coll_strata = 10
+        #Default frequency and ngram list length
+        self.freq_top = 50
         self.last_out = ''
+        #Whether the next queued command runs under cProfile and tracemalloc
+        self.profile_next = False
 
         #Test/Research default loading of the National Media Protest Corpora (Commented out)
         #self.preload('C:/Users/cbech/Desktop/NLP/BechConc/new_us_corpora.txt')
@@ -108,11 +127,14 @@ Commands:
                     #Break if input is exit command
                     break
                 print("Number of texts loaded:", len(self.text_list))
+            except KeyboardInterrupt:
+                #Ctrl-C stops a slow clean or lemmatization without exiting
+                print("\nCancelled")
             except Exception as e:
                 print(e)
             #Check if finished
-            self.comm = input("Load texts as corpora? Y/N: ")
             try:
+                self.comm = input("Load texts as corpora? Y/N: ")
                 if self.comm.lower() == "y":
                     if self.text_list != []:
                         print("Loading corpora...")
@@ -122,6 +144,11 @@ Commands:
                         print("Number of corpora loaded:", len(self.corpus_list))
                     else :
                         self.comm="exit"
+            except KeyboardInterrupt:
+                #Ctrl-C stops loading; texts are kept and any partly built corpora are rebuilt next time
+                self.comm = ""
+                self.corpus_list = []
+                print("\nCancelled")
             except Exception as e:
                 print(e)
     
@@ -133,53 +160,126 @@ Commands:
             corp_ind = len(self.corpus_list)-1
             self.corpus = self.corpus_list[corp_ind][1]
             print("Corpus Selected:", self.corpus_list[corp_ind][0], "| Tokens in corpus:", len(self.corpus._text))
+            #Worker thread for running searches in the background
+            self.worker = Worker()
             #Actual loop
             while (self.comm not in self.QUIT):
-                self.comm = input("->")
-                parsed = self.comm.split(' ')
-                #Check number of commands
-                if "conc" in parsed[0]:
-                    self.conc_comm(parsed)
-                elif "coll" in parsed[0]:
-                    self.coll_comm(parsed)
-                elif "parse" in parsed[0]:
-                    self.parse_agency_comm(parsed)
-                elif "list" in parsed[0]:
-                    self.list_corpora()
-                elif "save" in parsed[0]:
-                    self.save_output()
-                elif parsed[0].lower() == "settings" : 
-                    self.settings()
-                elif parsed[0].lower() == "help" : 
-                    print(self.help_text)
-                elif parsed[0].lower() == "switch" :
-                    if corp_ind < len(self.corpus_list)-1:
-                        corp_ind +=1
-                    else :
-                        corp_ind = 0
-                    self.corpus = self.corpus_list[corp_ind][1]
-                    print("Corpus Selected:", self.corpus_list[corp_ind][0], "| Tokens in corpus:", len(self.corpus._text))
+                #Ctrl-C anywhere in the loop (including settings and save prompts) cancels rather than exits
+                try:
+                    self.comm = input("->")
+                    parsed = self.comm.split(' ')
+                    #Check number of commands, queueing searches on the worker with the current corpus
+                    if "conc" in parsed[0]:
+                        self.submit(self.conc_comm, parsed)
+                    elif "coll" in parsed[0]:
+                        self.submit(self.coll_comm, parsed)
+                    elif "parse" in parsed[0]:
+                        self.submit(self.parse_agency_comm, parsed)
+                    elif "freq" in parsed[0]:
+                        self.submit(self.freq_comm, parsed)
+                    elif "ngram" in parsed[0]:
+                        self.submit(self.ngram_comm, parsed)
+                    elif "stats" in parsed[0]:
+                        self.stats_comm(parsed)
+                    elif "jobs" in parsed[0]:
+                        self.list_jobs()
+                    elif "cancel" in parsed[0]:
+                        cancelled = self.worker.cancel(queued=(len(parsed) > 1 and parsed[1].lower() == 'all'))
+                        for task in cancelled:
+                            print("Cancelling", task.name + "...")
+                    elif "list" in parsed[0]:
+                        self.list_corpora()
+                    elif "save" in parsed[0]:
+                        self.save_output()
+                    elif parsed[0].lower() == "settings" : 
+                        self.settings()
+                    elif parsed[0].lower() == "help" : 
+                        print(self.help_text)
+                    elif parsed[0].lower() == "switch" :
+                        if corp_ind < len(self.corpus_list)-1:
+                            corp_ind +=1
+                        else :
+                            corp_ind = 0
+                        self.corpus = self.corpus_list[corp_ind][1]
+                        print("Corpus Selected:", self.corpus_list[corp_ind][0], "| Tokens in corpus:", len(self.corpus._text))
+                except KeyboardInterrupt:
+                    self.comm = ""
+                    print()
+                    cancelled = self.worker.cancel()
+                    if cancelled == []:
+                        print("Nothing to cancel, enter [quit] to exit")
+                    for task in cancelled:
+                        print("Cancelling", task.name + "...")
+            self.worker.close(timeout=1)
+
+
+    def submit(self, comm_func, parsed):
+        """Method for queueing a search command on the worker, recording its timings (and profile, if requested)"""
+        name = ' '.join(parsed)
+        capture = self.profile_next
+        self.profile_next = False
+        def run(corpus):
+            with profiling.command(name, capture) as record:
+                comm_func(parsed, corpus)
+            if capture:
+                print(profiling.format_command(record))
+        self.worker.submit(name, run, self.corpus)
+
+    def stats_comm(self, inpt):
+        """Method for displaying, exporting, or requesting profiles of command timings"""
+        try:
+            if len(inpt) == 1:
+                if profiling.history == []:
+                    print("No commands recorded yet")
+                else:
+                    print(profiling.format_command(profiling.history[-1]))
+            elif inpt[1].lower() == 'all':
+                print(profiling.format_stages(profiling.totals))
+            elif inpt[1].lower() == 'export' and len(inpt) == 3:
+                profiling.export_json(inpt[2])
+                print("Stats written to", inpt[2])
+            elif inpt[1].lower() == 'profile':
+                self.profile_next = True
+                print("Next command will be profiled")
+            elif inpt[1].lower() == 'reset':
+                profiling.reset()
+            else:
+                raise ValueError("Stats takes [all], [export] |filename|, [profile], or [reset]")
+        except Exception as e:
+            print(e)
 
+    def list_jobs(self):
+        """Method for printing the running command and any queued commands"""
+        jobs = self.worker.jobs()
+        if jobs == []:
+            print("No commands running")
+        for x in range(len(jobs)):
+            print("Running:" if x == 0 else "Queued:", jobs[x].status())
 
     def list_corpora(self):
         for c in self.corpus_list:
             print(c[0], "| Tokens:", len(c[1]._text))
 
 
-    def coll_comm(self, inpt):
+    def coll_comm(self, inpt, corpus):
         """Method for calling and processing collocation commands from parsed input"""
         key = None
         win = self.coll_win
         minfreq = self.coll_min_freq
         minscore = self.coll_min_score
+        strata = None
         #Parse command
         try:
+            #Check for approximate (uniform or stratified) sampling option
+            if len(inpt) >= 3 and inpt[-1].lower() in ('approx', 'strat'):
+                strata = 1 if inpt[-1].lower() == 'approx' else self.coll_strata
+                inpt.pop()
             if len(inpt) >=2:
                 key = inpt[1]
             else: 
                 print("[coll] command requires at least a key")
                 return None
-            if len(inpt) >= 3 and inpt[2].isalpha:
+            if len(inpt) >= 3 and inpt[2].isalpha():
                 key += ' ' + inpt[2]
                 inpt.pop(2)
             if len(inpt) >= 3:
@@ -193,11 +293,53 @@ Commands:
             elif len(inpt) > 5 : 
                 print("Collocation attempted, but too many arguments were given")
             print('Finding collocates of', key + '... ')
-            self.last_out = self.corpus.alt_format_collocates(self.corpus.alt_find_collocates(key, win, minfreq, minscore))
+            if strata is not None:
+                colls = corpus.sample_collocates(key, win, minfreq, minscore, strata=strata,
+                    time_limit=self.coll_time, precision=self.coll_precision/100)
+                self.last_out = corpus.format_sampled_collocates(colls)
+            else:
+                self.last_out = corpus.alt_format_collocates(corpus.alt_find_collocates(key, win, minfreq, minscore))
             print(self.coll_colorize(self.last_out, key))
         except Exception as e:
             print(e)
 
+    def freq_comm(self, inpt, corpus):
+        """Method for calling and processing frequency list commands from parsed input"""
+        top = self.freq_top
+        try:
+            if len(inpt) == 2:
+                top = int(inpt[1])
+            elif len(inpt) > 2:
+                raise ValueError('Frequency list attempted, but too many arguments were given')
+            self.last_out = corpus.format_freqs(corpus.freq_list(top))
+            print(self.last_out)
+        except Exception as e:
+            print(e)
+
+    def ngram_comm(self, inpt, corpus):
+        """Method for calling and processing ngram list commands from parsed input"""
+        top = self.freq_top
+        approx = None
+        try:
+            if len(inpt) >= 2:
+                n = int(inpt[1])
+            else:
+                print("[ngrams] command requires at least an ngram length")
+                return None
+            if len(inpt) >= 3 and inpt[-1].lower() == 'approx':
+                approx = True
+                inpt.pop()
+            if len(inpt) == 3:
+                top = int(inpt[2])
+            elif len(inpt) > 3:
+                raise ValueError('Ngram list attempted, but too many arguments were given')
+            print('Counting', str(n) + '-grams... ')
+            self.last_out = corpus.format_freqs(corpus.ngram_list(n, top, approx=approx))
+            print(self.last_out)
+        except Exception as e:
+            print(e)
+
+    @timed()
     def coll_colorize(self, text, key):
         """Method for colorizing collocate output"""
         text = self.conc_colorize(text, key)
@@ -214,7 +356,7 @@ Commands:
         output = '\n'.join(lines)
         return output
             
-    def conc_comm(self, inpt):
+    def conc_comm(self, inpt, corpus):
         """Method for calling and processing concordance commands from parsed input"""
         key = None
         width = self.conc_width
@@ -228,7 +370,7 @@ Commands:
                         width = int(inpt[2])
                     elif len(inpt) > 3:
                         raise ValueError("Index concordance attempted, but too many arguments were given")
-                    self.last_out = self.corpus.conc_format_line(key, width)
+                    self.last_out = corpus.conc_format_line(key, width)
                     print(self.last_out)
                 #Regular concordance search
                 else : 
@@ -242,11 +384,12 @@ Commands:
                             width = int(inpt[2])
                     elif len(inpt) > 3:
                         raise ValueError('Concordance attempted, but too many arguments were given')
-                    self.last_out = self.corpus.conc_mult(key, width)
+                    self.last_out = corpus.conc_mult(key, width)
                     print(self.conc_colorize(self.last_out, key))
         except Exception as e:
             print(e)
 
+    @timed()
     def conc_colorize(self, text, key):
         """Method for colorizing a given string of keys within a text (modeled specifically for concordances)"""
         keys = key.split(' ')
@@ -282,7 +425,7 @@ Commands:
         except Exception as e:
             print(e)
     
-    def parse_agency_comm(self, inpt):
+    def parse_agency_comm(self, inpt, corpus):
         """Method for calling and processing dependency parsing commands from parsed input"""
         try:
             if len(inpt) > 1:
@@ -294,7 +437,7 @@ Commands:
                 while len(inpt) >= 3:
                     key += ' ' + str(inpt[2])
                     inpt.pop(2)
-                sents = self.corpus.sentence_search(key)
+                sents = corpus.sentence_search(key)
                 agency_list = agency_parse(sents)
                 print(analyze_agency(agency_list, key))
             else :
@@ -309,6 +452,9 @@ Commands:
             print("—Concordance Settings—\n[span]:", self.conc_width)
             print("—Collocation Settings—\n[win]dow:", self.coll_win, "| minimum [freq]uency:", 
                 self.coll_min_freq, "| minimum [score]:", self.coll_min_score)
+            print("—Approximate Collocation Settings—\n[time] limit:", self.coll_time, "| [prec]ision %:",
+                self.coll_precision, "| [strata]:", self.coll_strata)
+            print("—List Settings—\n[top] items:", self.freq_top)
             comm = input('\\_>')
             parsed = comm.split(' ')
             try:
@@ -321,6 +467,14 @@ Commands:
                         self.coll_min_freq = int(parsed[1])
                     if 'score' in parsed[0]:
                         self.coll_min_score = int(parsed[1])
+                    if 'time' in parsed[0]:
+                        self.coll_time = int(parsed[1])
+                    if 'prec' in parsed[0]:
+                        self.coll_precision = int(parsed[1])
+                    if 'strata' in parsed[0]:
+                        self.coll_strata = int(parsed[1])
+                    if 'top' in parsed[0]:
+                        self.freq_top = int(parsed[1])
                     print()
                 elif comm.lower() != 'back':
                     print('Please enter a setting and a new integer value, or go [back]')
@@ -0,0 +1,214 @@
+"""
+This module implements a reproducible benchmark suite for the corpus and syntax
+modules, timing corpus building, concordance, collocation, and parsing on
+synthetic Zipfian corpora generated offline, and recording peak memory with
+tracemalloc. Results are written as JSON so runs on different versions can be
+compared to catch regressions.
+
+Usage:
+    python bench.py --sizes 1000000 10000000 -o new.json
+    python bench.py --compare old.json new.json
+
+Corpora of 100M tokens (--sizes 100000000) are supported but need tens of GB
+of memory for the nltk collocation finders; use --ops to limit which
+operations run at that size. Operations that fail (e.g. ones missing from an
+older checkout) are recorded with an error and skipped when comparing.
+
+peak_mb comes from tracemalloc, which only sees allocations made through
+Python's allocator; spaCy's native allocations are left out, so the figures
+for lemmatize_corpus and agency_parse are understated.
+
+@author: Connor Bechler
+@date: Fall, 2020
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import nltk
+import spacy
+from corpus import lemmatize_corpus, Corpus
+from syntax import agency_parse
+
+#Operations in the order they run; each takes a benchmark context dictionary
+OPS = ['corpus_init', 'conc_mult', 'conc_mult_pair', 'find_collocates', 'alt_find_collocates', 'sample_collocates',
+       'freq_list', 'ngram_list', 'sentence_search', 'lemmatize_corpus', 'agency_parse']
+
+def make_word(rank):
+    """Function which returns a deterministic lowercase word form for a vocabulary rank"""
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    word = ''
+    rank += 1
+    while rank > 0:
+        rank, rem = divmod(rank - 1, 26)
+        word = letters[rem] + word
+    #Pad short forms so they don't collide with real English function words
+    return 'q' + word
+
+def synthetic_corpus(tokens, vocab=50000, zipf=1.07, seed=0):
+    """Function which generates a cleaned text of roughly the given number of tokens,
+    with words drawn from a Zipfian distribution and sentences of 5 to 30 words"""
+    rand = random.Random(seed)
+    words = [make_word(r) for r in range(vocab)]
+    cum_weights = []
+    total = 0.0
+    for r in range(vocab):
+        total += 1 / (r + 1) ** zipf
+        cum_weights.append(total)
+    lines = []
+    count = 0
+    while count < tokens:
+        length = rand.randint(5, 30)
+        sent = rand.choices(words, cum_weights=cum_weights, k=length)
+        sent[0] = sent[0].capitalize()
+        lines.append(' '.join(sent) + ' .')
+        #Each sentence's final period is its own token
+        count += length + 1
+    return '\n'.join(lines) + '\n', words
+
+def run_op(op, ctx):
+    """Function which runs a single benchmark operation on the context"""
+    corpus = ctx['corpus']
+    if op == 'corpus_init':
+        ctx['corpus'] = Corpus(nltk.PorterStemmer(), ctx['text'])
+    elif op == 'conc_mult':
+        corpus.conc_mult(ctx['mid'])
+    elif op == 'conc_mult_pair':
+        corpus.conc_mult(ctx['mid'] + ' ' + ctx['high'])
+    elif op == 'find_collocates':
+        corpus.find_collocates(ctx['mid'], 5, 20, 0)
+    elif op == 'alt_find_collocates':
+        corpus.alt_find_collocates(ctx['mid'], 5, 20, 0)
+    elif op == 'sample_collocates':
+        #Fixed workload: no time budget or precision target, so every occurrence is sampled and slowdowns show up as time
+        corpus.sample_collocates(ctx['high'], 5, 20, 0, batch=500, time_limit=float('inf'), precision=0, seed=0)
+    elif op == 'freq_list':
+        corpus.freq_list(100)
+    elif op == 'ngram_list':
+        corpus.ngram_list(3, 100)
+    elif op == 'sentence_search':
+        corpus.sentence_search(ctx['mid'])
+    elif op == 'lemmatize_corpus':
+        lemmatize_corpus(ctx['nlp_text'])
+    elif op == 'agency_parse':
+        agency_parse(ctx['nlp_sents'])
+    else:
+        raise ValueError('Unknown benchmark operation: ' + op)
+
+def measure(op, ctx, repeat=3, memory=True):
+    """Function which times an operation repeat times and, if memory is True, measures its
+    peak traced memory in a separate run so tracing overhead doesn't skew the timings"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_op(op, ctx)
+        times.append(time.perf_counter() - start)
+    result = {'times': times, 'min': min(times), 'median': statistics.median(times)}
+    if memory:
+        tracemalloc.start()
+        try:
+            run_op(op, ctx)
+            result['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    return result
+
+def metadata(args):
+    """Function returning environment details needed to compare result files"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'date': datetime.now().isoformat(), 'commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'nltk': nltk.__version__, 'spacy': spacy.__version__,
+            'seed': args.seed, 'vocab': args.vocab, 'zipf': args.zipf, 'repeat': args.repeat,
+            'nlp_tokens': args.nlp_tokens, 'nlp_sents': args.nlp_sents}
+
+def run_benchmarks(args):
+    """Function which runs every selected operation on every corpus size and returns the results"""
+    results = []
+    for size in args.sizes:
+        print('Generating', size, 'token corpus...')
+        text, words = synthetic_corpus(size, args.vocab, args.zipf, args.seed)
+        #Keys: the most frequent word and a mid frequency word
+        ctx = {'text': text, 'corpus': Corpus(nltk.PorterStemmer(), text), 'high': words[0], 'mid': words[99]}
+        #spaCy operations run on a capped slice of the corpus, since they scale far worse than the rest
+        ctx['nlp_text'] = ' '.join(text.split(' ')[:args.nlp_tokens])
+        ctx['nlp_sents'] = ctx['corpus'].sentence_search(ctx['mid'])[:args.nlp_sents]
+        for op in args.ops:
+            print('Running', op, 'on', size, 'tokens...')
+            #Record failures instead of losing the results measured so far
+            try:
+                result = measure(op, ctx, args.repeat, not args.no_memory)
+            except Exception as e:
+                result = {'error': repr(e)}
+                print(op, '| failed:', repr(e))
+            else:
+                print(op, '| min:', round(result['min'], 4), 's | peak:', round(result.get('peak_mb', 0), 2), 'MB')
+            result.update({'size': size, 'op': op})
+            results.append(result)
+    return {'meta': metadata(args), 'results': results}
+
+def compare(old_file, new_file, threshold=0.1):
+    """Function which prints time and memory changes between two result files and returns
+    the number of operations that got more than threshold slower or larger"""
+    with open(old_file) as f:
+        old = {(r['size'], r['op']): r for r in json.load(f)['results']}
+    with open(new_file) as f:
+        new = {(r['size'], r['op']): r for r in json.load(f)['results']}
+    regressions = 0
+    format_string = '{size:<12}{op:<28}{old:<12}{new:<12}{change:<10}{flag}'
+    print(format_string.format(size='Size', op='Operation', old='Old', new='New', change='Change', flag=''))
+    for key in sorted(set(old) & set(new)):
+        if 'error' in old[key] or 'error' in new[key]:
+            print(format_string.format(size=key[0], op=key[1], old='', new='', change='', flag='skipped (error)'))
+            continue
+        for stat, unit in (('min', 's'), ('peak_mb', 'MB')):
+            if stat not in old[key] or stat not in new[key] or old[key][stat] == 0:
+                continue
+            change = new[key][stat] / old[key][stat] - 1
+            flag = ''
+            #Ignore sub-millisecond timing differences, which are mostly noise
+            if change > threshold and not (stat == 'min' and new[key][stat] - old[key][stat] < 0.001):
+                flag = 'REGRESSION'
+                regressions += 1
+            print(format_string.format(size=key[0], op=key[1] + ' ' + stat, old=str(round(old[key][stat], 3)) + unit,
+                                       new=str(round(new[key][stat], 3)) + unit, change='{:+.1%}'.format(change), flag=flag))
+    return regressions
+
+def main(argv=None):
+    """Benchmark command line entry point"""
+    parser = argparse.ArgumentParser(description='Benchmark corpus building, concordance, collocation and parsing')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000], help='corpus sizes in tokens')
+    parser.add_argument('--ops', nargs='+', default=OPS, choices=OPS, help='operations to benchmark')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per operation')
+    parser.add_argument('--vocab', type=int, default=50000, help='synthetic vocabulary size')
+    parser.add_argument('--zipf', type=float, default=1.07, help='Zipf exponent of the word distribution')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for corpus generation')
+    parser.add_argument('--nlp-tokens', type=int, default=20000, help='tokens passed to lemmatize_corpus')
+    parser.add_argument('--nlp-sents', type=int, default=200, help='sentences passed to agency_parse')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory runs')
+    parser.add_argument('-o', '--output', default='bench_results.json', help='JSON results file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files instead of running')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown reported as a regression')
+    args = parser.parse_args(argv)
+    if args.compare:
+        regressions = compare(args.compare[0], args.compare[1], args.threshold)
+        print(regressions, 'regression(s) found')
+        return 1 if regressions else 0
+    results = run_benchmarks(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results written to', args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -10,9 +10,16 @@ https://www.nltk.org/_modules/nltk/collocations.html
 @date: Spring, 2020
 """
 
+import heapq
+import math
+import random
+import time
 import nltk
 from nltk.collocations import BigramAssocMeasures, BigramCollocationFinder, TrigramAssocMeasures, TrigramCollocationFinder
 import spacy
+from freq import dispersion, iter_ngrams, heavy_hitters
+from tasks import check, report, track
+from profiling import stage, timed
 
 #Initialize general lemmatizing/parsing tools
 nlp = spacy.load("en_core_web_sm")
@@ -35,10 +42,12 @@ def clean_corpus(text):
         newtext += line
     return newtext
 
+@timed()
 def lemmatize_corpus(text):
     """Function producing a lemmatized version of a given text"""
     #Tokenize for processing
-    text_tokens = nltk.word_tokenize(text)
+    with stage('tokenize'):
+        text_tokens = nltk.word_tokenize(text)
     token_num = len(text_tokens)
     #Chunk texts to permit spacy parsing
     token_limit = 10000
@@ -51,16 +60,16 @@ def lemmatize_corpus(text):
     chunks.append(txt)
     #lemmatize chunks
     lemmas = []
-    print('Chunks:', chunk_num)
     cur = 1
     for chunk in chunks:
-        doc = lem(chunk)
+        with stage('spacy lemmatizer'):
+            doc = lem(chunk)
         for token in doc:
             try:
                 lemmas.append(token.lemma_)
             except:
                 lemmas.append(token.text)
-        print('Chunk', cur, 'of', chunk_num, 'processed')
+        report('Chunks lemmatized', cur, len(chunks))
         cur += 1
     newtext = " ".join(lemmas)
     
@@ -71,16 +80,22 @@ class Corpus(object):
        conc_format_lines and concordance are a decomposed form of their original concordance function,
        which conc_collocate is strongly modeled after.
     """
+    #Token count above which ngram lists of length 3+ are counted approximately
+    approx_limit = 5000000
     
+    @timed('corpus build')
     def __init__(self, stemmer, raw):
         """Initializes indexed text with index of stemmed words as tokens"""
         self._raw = raw 
-        self._tokens = nltk.word_tokenize(raw)
+        with stage('tokenize'):
+            self._tokens = nltk.word_tokenize(raw)
         self._text = self._tokens
         #Kind of legacy, but here just in case I end up re-implementing stemming
         self._stemmer = stemmer
-        self._index = nltk.Index((word, i) for (i, word) in enumerate(self._text))
-        self._sents = nltk.sent_tokenize(self._raw)
+        with stage('index'):
+            self._index = nltk.Index((word, i) for (i, word) in enumerate(self._text))
+        with stage('sentence tokenize'):
+            self._sents = nltk.sent_tokenize(self._raw)
 
     def conc_format_line(self, ind, width=50):
         """Method to return or print a specified concordance line"""
@@ -115,13 +130,16 @@ class Corpus(object):
                 output += self.conc_format_line(i, width)
         return output
 
+    @timed()
     def conc_mult(self, word, width=50):
         """Method which prints all concordance lines for a given sequence of words within a given character-span"""
         keys = nltk.word_tokenize(word)
         wc = int(width/4)
         output = ""
         #Get concordance lines with first (or only) key
-        for i in self._index[keys[0]]:
+        for n, i in enumerate(self._index[keys[0]]):
+            if n % 10000 == 0:
+                check()
             #Check if more than one key
             if len(keys) > 1:
                 context = ' '.join(self._text[i-wc:i+wc])
@@ -144,17 +162,22 @@ class Corpus(object):
         """LEGACY Method which lowercases and stems a given word"""
         return self._stemmer.stem(word).lower()
     
+    @timed()
     def sentence_search(self, key):
         """Method which pulls sentences with specific keywords from corpus and returns them as a string
         TODO: Make function not bound to two keys"""
         output = []
         keys = nltk.word_tokenize(key)
         if len(keys) == 1:
-            for sent in self._sents:
+            for n, sent in enumerate(self._sents):
+                if n % 10000 == 0:
+                    report('Sentences searched', n, len(self._sents))
                 if key in sent:
                     output.append(sent)
         elif len(keys) == 2 :
-            for sent in self._sents:
+            for n, sent in enumerate(self._sents):
+                if n % 10000 == 0:
+                    report('Sentences searched', n, len(self._sents))
                 if (keys[0] in sent) and (keys[1] in sent):
                     output.append(sent)
         return output
@@ -181,6 +204,7 @@ class Corpus(object):
             output += "\n"
         return output
 
+    @timed()
     def find_collocates(self, key, win=5, min_freq=1, min_score=0):
         """Method to give all collocations for a given score
         http://www.nltk.org/howto/collocations.html
@@ -190,57 +214,68 @@ class Corpus(object):
         if len(keys) == 1:
             #Initialize ngram list of bigrams
             bgrm_msr = BigramAssocMeasures()
-            finder = BigramCollocationFinder.from_words(self._text, window_size=win)
-            finder.apply_freq_filter(min_freq)
-            ngram_list = finder.score_ngrams(bgrm_msr.pmi)
+            with stage('ngram counting'):
+                finder = BigramCollocationFinder.from_words(track(self._text, 'Tokens counted'), window_size=win)
+            check()
+            with stage('freq filter'):
+                finder.apply_freq_filter(min_freq)
+            with stage('pmi scoring'):
+                ngram_list = finder.score_ngrams(bgrm_msr.pmi)
             #Find bigrams with key
-            for x in range(len(ngram_list)):
-                if ngram_list[x][1] >= min_score:
-                    #Check if the non-key part of bigram is to the right of key1
-                    if (key in ngram_list[x][0][0]):    
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][1], ngram_list[x][1], 'R', freq))
-                    #... or to the left of key 1
-                    elif (key in ngram_list[x][0][1]):
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][0], ngram_list[x][1], 'L', freq))
+            with stage('key scan'):
+                for x in range(len(ngram_list)):
+                    if ngram_list[x][1] >= min_score:
+                        #Check if the non-key part of bigram is to the right of key1
+                        if (key in ngram_list[x][0][0]):    
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][1], ngram_list[x][1], 'R', freq))
+                        #... or to the left of key 1
+                        elif (key in ngram_list[x][0][1]):
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][0], ngram_list[x][1], 'L', freq))
         elif len(keys) == 2:
             #Initialize ngram list of trigrams
             tgram_msr = TrigramAssocMeasures()
-            finder = TrigramCollocationFinder.from_words(self._text, window_size=win)
-            finder.apply_freq_filter(min_freq)
-            ngram_list = finder.score_ngrams(tgram_msr.pmi)
+            with stage('ngram counting'):
+                finder = TrigramCollocationFinder.from_words(track(self._text, 'Tokens counted'), window_size=win)
+            check()
+            with stage('freq filter'):
+                finder.apply_freq_filter(min_freq)
+            with stage('pmi scoring'):
+                ngram_list = finder.score_ngrams(tgram_msr.pmi)
             #Find trigrams with keys
-            for x in range(len(ngram_list)):
-                if ngram_list[x][1] >= min_score:
-                    #Check if the non-key part of trigram is to the right of key1 and key2
-                    if (keys[0] in ngram_list[x][0][0]) and (keys[1] in ngram_list[x][0][1]):    
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][2], ngram_list[x][1], '1 2 X', freq))
-                    #... or to the left of key 1 and key 2
-                    elif (keys[0] in ngram_list[x][0][1]) and (keys[1] in ngram_list[x][0][2]):
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][0], ngram_list[x][1], 'X 1 2', freq))
-                    #... or between key 1 and key 2
-                    elif (keys[0] in ngram_list[x][0][0]) and (keys[1] in ngram_list[x][0][2]):
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][1], ngram_list[x][1], '1 X 2', freq))
-                    #... or between key 2 and key 1
-                    elif (keys[0] in ngram_list[x][0][2]) and (keys[1] in ngram_list[x][0][0]):
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][1], ngram_list[x][1], '1 X 2', freq))
-                    #... or to the right of key 2 and key 1
-                    elif (keys[0] in ngram_list[x][0][1]) and (keys[1] in ngram_list[x][0][0]):    
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][2], ngram_list[x][1], '2 1 X', freq))
-                    #... or to the left of key 2 and key 1
-                    elif (keys[0] in ngram_list[x][0][2]) and (keys[1] in ngram_list[x][0][1]):
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][0], ngram_list[x][1], 'X 2 1', freq))
+            with stage('key scan'):
+                for x in range(len(ngram_list)):
+                    if ngram_list[x][1] >= min_score:
+                        #Check if the non-key part of trigram is to the right of key1 and key2
+                        if (keys[0] in ngram_list[x][0][0]) and (keys[1] in ngram_list[x][0][1]):    
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][2], ngram_list[x][1], '1 2 X', freq))
+                        #... or to the left of key 1 and key 2
+                        elif (keys[0] in ngram_list[x][0][1]) and (keys[1] in ngram_list[x][0][2]):
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][0], ngram_list[x][1], 'X 1 2', freq))
+                        #... or between key 1 and key 2
+                        elif (keys[0] in ngram_list[x][0][0]) and (keys[1] in ngram_list[x][0][2]):
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][1], ngram_list[x][1], '1 X 2', freq))
+                        #... or between key 2 and key 1
+                        elif (keys[0] in ngram_list[x][0][2]) and (keys[1] in ngram_list[x][0][0]):
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][1], ngram_list[x][1], '1 X 2', freq))
+                        #... or to the right of key 2 and key 1
+                        elif (keys[0] in ngram_list[x][0][1]) and (keys[1] in ngram_list[x][0][0]):    
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][2], ngram_list[x][1], '2 1 X', freq))
+                        #... or to the left of key 2 and key 1
+                        elif (keys[0] in ngram_list[x][0][2]) and (keys[1] in ngram_list[x][0][1]):
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][0], ngram_list[x][1], 'X 2 1', freq))
         else:
             raise ValueError('Can only handle bigrams and trigrams')
         return collocates
 
+    @timed()
     def alt_find_collocates(self, key, win=5, min_freq=1, min_score=0):
         """Method to give all collocations for a given score
         http://www.nltk.org/howto/collocations.html
@@ -250,31 +285,198 @@ class Corpus(object):
         if len(keys) == 1:
             #Initialize ngram list of bigrams
             bgrm_msr = BigramAssocMeasures()
-            finder = BigramCollocationFinder.from_words(self._text, window_size=win)
-            finder.apply_freq_filter(min_freq)
-            ngram_list = finder.score_ngrams(bgrm_msr.pmi)
+            with stage('ngram counting'):
+                finder = BigramCollocationFinder.from_words(track(self._text, 'Tokens counted'), window_size=win)
+            check()
+            with stage('freq filter'):
+                finder.apply_freq_filter(min_freq)
+            with stage('pmi scoring'):
+                ngram_list = finder.score_ngrams(bgrm_msr.pmi)
             #Find bigrams with key
-            for x in range(len(ngram_list)):
-                if ngram_list[x][1] >= min_score:
-                    if (key in ngram_list[x][0]):    
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][0] + ' ' + ngram_list[x][0][1], freq, ngram_list[x][1]))
+            with stage('key scan'):
+                for x in range(len(ngram_list)):
+                    if ngram_list[x][1] >= min_score:
+                        if (key in ngram_list[x][0]):    
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][0] + ' ' + ngram_list[x][0][1], freq, ngram_list[x][1]))
         elif len(keys) == 2:
             #Initialize ngram list of trigrams
             tgram_msr = TrigramAssocMeasures()
-            finder = TrigramCollocationFinder.from_words(self._text, window_size=win)
-            finder.apply_freq_filter(min_freq)
-            ngram_list = finder.score_ngrams(tgram_msr.pmi)
+            with stage('ngram counting'):
+                finder = TrigramCollocationFinder.from_words(track(self._text, 'Tokens counted'), window_size=win)
+            check()
+            with stage('freq filter'):
+                finder.apply_freq_filter(min_freq)
+            with stage('pmi scoring'):
+                ngram_list = finder.score_ngrams(tgram_msr.pmi)
             #Find trigrams with keys
-            for x in range(len(ngram_list)):
-                if ngram_list[x][1] >= min_score:
-                    if (keys[0] in ngram_list[x][0]) and (keys[1] in ngram_list[x][0]):    
-                        freq = finder.ngram_fd[ngram_list[x][0]]
-                        collocates.append((ngram_list[x][0][0] + ' ' + ngram_list[x][0][1] + ' ' + ngram_list[x][0][2], freq, ngram_list[x][1]))
+            with stage('key scan'):
+                for x in range(len(ngram_list)):
+                    if ngram_list[x][1] >= min_score:
+                        if (keys[0] in ngram_list[x][0]) and (keys[1] in ngram_list[x][0]):    
+                            freq = finder.ngram_fd[ngram_list[x][0]]
+                            collocates.append((ngram_list[x][0][0] + ' ' + ngram_list[x][0][1] + ' ' + ngram_list[x][0][2], freq, ngram_list[x][1]))
         else:
             raise ValueError('Can only handle bigrams and trigrams')
         return collocates
 
+    @timed()
+    def freq_list(self, top=100, parts=100):
+        """Method which returns the top most frequent words with their frequency, range, and Juilland's D"""
+        freqs = []
+        words = heapq.nlargest(top, self._index, key=lambda w: len(self._index[w]))
+        for word in words:
+            rng, juilland = dispersion(self._index[word], len(self._text), parts)
+            freqs.append((word, len(self._index[word]), rng, juilland))
+        return freqs
+
+    @timed()
+    def ngram_list(self, n=2, top=100, parts=100, approx=None):
+        """Method which returns the top most frequent ngrams of length n with their frequency, range, and Juilland's D;
+        ngrams of length 3+ in corpora over approx_limit tokens are counted approximately with a count-min sketch
+        unless approx is set explicitly"""
+        if n < 1:
+            raise ValueError('Ngram length must be at least 1')
+        if top < 1:
+            raise ValueError('Ngram list length must be at least 1')
+        if approx is None:
+            approx = n >= 3 and len(self._text) > self.approx_limit
+        ngrams = (ngram for (i, ngram) in iter_ngrams(self._text, n))
+        with stage('ngram counting'):
+            if approx:
+                top_ngrams = heavy_hitters(ngrams, top)
+            else:
+                top_ngrams = nltk.FreqDist(ngrams).most_common(top)
+        #Second pass collecting positions for the top ngrams only, to keep memory bounded
+        with stage('positions'):
+            positions = {ngram: [] for (ngram, freq) in top_ngrams}
+            for i, ngram in iter_ngrams(self._text, n):
+                if ngram in positions:
+                    positions[ngram].append(i)
+        freqs = []
+        with stage('dispersion'):
+            for ngram, freq in top_ngrams:
+                rng, juilland = dispersion(positions[ngram], len(self._text), parts)
+                #Approximate counts are replaced by exact ones now that positions are known
+                freqs.append((' '.join(ngram), len(positions[ngram]), rng, juilland))
+        if approx:
+            freqs.sort(key=lambda x: x[1], reverse=True)
+        return freqs
+
+    @timed()
+    def format_freqs(self, freqs, pr=False):
+        """Method to properly format or print a given list of word or ngram frequencies"""
+        output = '     Item\t\t\t\t\t     Frequency\t     Range\t     Juilland D\n'
+        format_string = '{rank:<5}{item:<40}{freq:<16}{rng:<16}{juilland:<6}'
+        for i in range(len(freqs)):
+            output += format_string.format(rank=i+1, item=freqs[i][0], freq=freqs[i][1], rng=freqs[i][2], juilland=round(freqs[i][3], 4)) + '\n'
+        if pr :
+            print(output)
+        else :
+            return output
+
+    @timed()
+    def sample_collocates(self, key, win=5, min_freq=1, min_score=0, strata=1, batch=500,
+                          time_limit=10, precision=0.1, top=50, seed=None):
+        """Method to estimate collocations for a very frequent key by sampling its occurrences;
+        occurrences are sampled in doubling batches (uniformly, or stratified over equal sized corpus parts if strata > 1)
+        until time_limit seconds have passed, the top collocates' 95% confidence intervals are within precision
+        of their estimated frequency, or every occurrence has been seen.
+        Returns (collocation, estimated frequency, score, score lower bound, score upper bound) tuples
+        with the same pmi scoring as alt_find_collocates
+        """
+        if len(nltk.word_tokenize(key)) != 1:
+            raise ValueError('Approximate collocation can only handle a single key')
+        positions = self._index[key]
+        corpus_len = len(self._text)
+        key_freq = len(positions)
+        if key_freq == 0:
+            return []
+        rand = random.Random(seed)
+        #Shuffle occurrences within each stratum so that any prefix is a random sample
+        groups = [[] for _ in range(strata)]
+        for pos in positions:
+            groups[pos * strata // corpus_len].append(pos)
+        groups = [g for g in groups if g != []]
+        for g in groups:
+            rand.shuffle(g)
+        sampled = [0] * len(groups)
+        #Per stratum sums and sums of squares of each collocate's count per sampled window
+        sums = [{} for _ in groups]
+        sumsq = [{} for _ in groups]
+        span = max(win - 1, 1)
+        start = time.perf_counter()
+        drawn = 0
+        collocates = []
+        while True:
+            #Draw the next batch proportionally from each stratum
+            with stage('sampling'):
+                out_of_time = False
+                for h, g in enumerate(groups):
+                    take = min(len(g) - sampled[h], max(1, batch * len(g) // key_freq))
+                    for pos in g[sampled[h]:sampled[h]+take]:
+                        #Check for cancellation and the time limit within batches, once every stratum has a sample
+                        drawn += 1
+                        if drawn % 2000 == 0:
+                            check()
+                            if all(sampled) and time.perf_counter() - start >= time_limit:
+                                out_of_time = True
+                                break
+                        counts = {}
+                        for word in self._text[max(0, pos-span):pos]:
+                            #Pairs of the key with itself are only counted rightwards, as in alt_find_collocates
+                            if word == key:
+                                continue
+                            counts[(word, 'L')] = counts.get((word, 'L'), 0) + 1
+                        for word in self._text[pos+1:pos+1+span]:
+                            counts[(word, 'R')] = counts.get((word, 'R'), 0) + 1
+                        for k, x in counts.items():
+                            sums[h][k] = sums[h].get(k, 0) + x
+                            sumsq[h][k] = sumsq[h].get(k, 0) + x * x
+                        sampled[h] += 1
+                    if out_of_time:
+                        break
+            report('Occurrences sampled', sum(sampled), key_freq)
+            #Estimate totals and their variance from the sample so far
+            with stage('estimation'):
+                seen = set().union(*sums)
+                collocates = []
+                for k in seen:
+                    est = 0.0
+                    var = 0.0
+                    for h, g in enumerate(groups):
+                        n = sampled[h]
+                        if k not in sums[h]:
+                            continue
+                        #Scale before dividing so a full sample (n == len(g)) gives exact counts
+                        est += len(g) * sums[h][k] / n
+                        if 1 < n < len(g):
+                            s2 = (sumsq[h][k] - sums[h][k] * sums[h][k] / n) / (n - 1)
+                            var += len(g) * (len(g) - n) * s2 / n
+                    if est < min_freq:
+                        continue
+                    half = 1.96 * math.sqrt(var)
+                    denom = key_freq * len(self._index[k[0]])
+                    score = math.log2(est / span * corpus_len / denom)
+                    if score < min_score:
+                        continue
+                    lo = math.log2((est - half) / span * corpus_len / denom) if est > half else float('-inf')
+                    hi = math.log2((est + half) / span * corpus_len / denom)
+                    if k[1] == 'R':
+                        collocation = key + ' ' + k[0]
+                    else:
+                        collocation = k[0] + ' ' + key
+                    collocates.append((collocation, est, score, lo, hi, half))
+            collocates.sort(key=lambda x: x[2], reverse=True)
+            done = sum(sampled) >= key_freq
+            precise = all(c[5] <= precision * c[1] for c in collocates[:top])
+            if done or precise or time.perf_counter() - start >= time_limit:
+                break
+            #Grow batches so that re-estimation cost stays small relative to sampling
+            batch *= 2
+        return [c[:5] for c in collocates]
+
+    @timed()
     def format_collocates(self, colls, pr=False):
         """Method to properly format or print a given list of collocates"""
         output = '     Collocate\t     Location\t     Frequency\t     Score\n'
@@ -286,6 +488,7 @@ class Corpus(object):
         else :
             return output
 
+    @timed()
     def alt_format_collocates(self, colls, pr=False):
         """Method to properly format or print a given list of collocates"""
         output = '     Collocation\t     \t     Frequency\t     Score\n'
@@ -297,6 +500,19 @@ class Corpus(object):
         else :
             return output
 
+    @timed()
+    def format_sampled_collocates(self, colls, pr=False):
+        """Method to properly format or print a given list of sampled collocates with score confidence intervals"""
+        output = '     Collocation\t     \t     Frequency\t     Score\t     95% CI\n'
+        format_string = '{rank:<5}{collocation:<40}{freq:<16}{score:<16}{lo} - {hi}'
+        for i in range(len(colls)):
+            output += format_string.format(rank=i+1, collocation=colls[i][0], freq=round(colls[i][1]), score=round(colls[i][2], 4),
+                                           lo=round(colls[i][3], 4), hi=round(colls[i][4], 4)) + '\n'
+        if pr :
+            print(output)
+        else :
+            return output
+
 #Test cases
 if __name__ == '__main__':
     
@@ -0,0 +1,139 @@
+"""
+This module implements frequency list helpers for the corpus module:
+dispersion statistics computed from token positions and a bounded-memory
+count-min sketch for approximate n-gram counting
+
+https://en.wikipedia.org/wiki/Count%E2%80%93min_sketch
+Gries, S. Th. (2008). Dispersions and adjusted frequencies in corpora.
+
+@author: Connor Bechler
+@date: Fall, 2020
+"""
+
+import heapq
+import math
+import random
+import zlib
+from collections import Counter
+import numpy as np
+from tasks import report
+
+def part_counts(positions, corpus_len, parts=100):
+    """Function which buckets an array of token positions into equal sized corpus parts and returns the count per part"""
+    if corpus_len == 0:
+        return np.zeros(parts, dtype=np.int64)
+    return np.bincount(np.asarray(positions, dtype=np.int64) * parts // corpus_len, minlength=parts)
+
+def dispersion(positions, corpus_len, parts=100):
+    """Function which returns the range (number of parts containing the item) and
+    Juilland's D for an array of token positions, treating the corpus as equal sized parts"""
+    counts = part_counts(positions, corpus_len, parts)
+    rng = int(np.count_nonzero(counts))
+    mean = counts.mean()
+    if parts < 2 or mean == 0:
+        return rng, 0.0
+    juilland = 1 - (counts.std() / mean) / math.sqrt(parts - 1)
+    return rng, max(0.0, float(juilland))
+
+def iter_ngrams(tokens, n):
+    """Generator yielding (position, ngram) pairs for every ngram of length n in a token list"""
+    total = len(tokens) - n + 1
+    for i in range(total):
+        if i % 1000000 == 0:
+            report('Tokens scanned', i, total)
+        yield i, tuple(tokens[i:i+n])
+    report('Tokens scanned', max(total, 0), max(total, 0))
+
+def stable_hash(item):
+    """Function returning a hash of an item (or ngram tuple) that, unlike hash(), is the same across runs"""
+    if isinstance(item, tuple):
+        item = ' '.join(str(word) for word in item)
+    return zlib.crc32(str(item).encode('utf8'))
+
+class CountMinSketch(object):
+    """Count-min sketch for approximate frequency counting in bounded memory;
+       estimates never undercount and overcount by at most 2N/width with probability 1 - (1/2)**depth
+    """
+    #Mersenne prime larger than any hash value
+    _PRIME = 2**61 - 1
+
+    def __init__(self, width=2**18, depth=4):
+        """Initializes an empty sketch of depth rows by width counters"""
+        self.width = width
+        self.depth = depth
+        self._rows = [[0] * width for _ in range(depth)]
+        #Independent universal hash parameters for each row
+        rand = random.Random(depth * width)
+        self._params = [(rand.randrange(1, self._PRIME), rand.randrange(self._PRIME)) for _ in range(depth)]
+
+    def _cells(self, item):
+        """Method returning the counter index of an item in each row"""
+        h = stable_hash(item)
+        return [((a * h + b) % self._PRIME) % self.width for (a, b) in self._params]
+
+    def add(self, item, count=1):
+        """Method which adds count occurrences of an item and returns its new estimate"""
+        est = None
+        for row, cell in zip(self._rows, self._cells(item)):
+            row[cell] += count
+            if est is None or row[cell] < est:
+                est = row[cell]
+        return est
+
+    def estimate(self, item):
+        """Method which returns the estimated count of an item"""
+        return min(row[cell] for row, cell in zip(self._rows, self._cells(item)))
+
+def heavy_hitters(items, top=100, width=2**18, depth=4):
+    """Function which approximates the top most frequent items of an iterable using
+    a count-min sketch, keeping at most top candidates in memory besides the sketch"""
+    if top < 1:
+        return []
+    sketch = CountMinSketch(width, depth)
+    candidates = {}
+    heap = []
+    for item in items:
+        est = sketch.add(item)
+        if item in candidates:
+            candidates[item] = est
+            heapq.heappush(heap, (est, item))
+        elif len(candidates) < top:
+            candidates[item] = est
+            heapq.heappush(heap, (est, item))
+        else:
+            #Drop stale heap entries until the real minimum candidate is on top
+            while heap[0][1] not in candidates or candidates[heap[0][1]] != heap[0][0]:
+                heapq.heappop(heap)
+            if est > heap[0][0]:
+                del candidates[heapq.heappop(heap)[1]]
+                candidates[item] = est
+                heapq.heappush(heap, (est, item))
+        #Rebuild heap when stale entries pile up
+        if len(heap) > 4 * top:
+            heap = [(c, i) for i, c in candidates.items()]
+            heapq.heapify(heap)
+    return sorted(candidates.items(), key=lambda x: x[1], reverse=True)
+
+#Test cases
+if __name__ == '__main__':
+
+    try:
+        #Evenly spread item has full range and D of 1, a clumped one range 1 and D of 0
+        assert dispersion(list(range(0, 1000, 10)), 1000, 10) == (10, 1.0)
+        assert dispersion([1, 2, 3], 1000, 10) == (1, 0.0)
+        assert dispersion([], 1000, 10) == (0, 0.0)
+        #Count-min estimates never undercount
+        rand = random.Random(0)
+        tokens = [str(int(rand.paretovariate(1))) for _ in range(100000)]
+        exact = Counter(ngram for (i, ngram) in iter_ngrams(tokens, 3))
+        sketch = CountMinSketch(4096, 4)
+        for ngram in exact:
+            sketch.add(ngram, exact[ngram])
+        assert all(sketch.estimate(ngram) >= exact[ngram] for ngram in exact)
+        #Heavy hitters find the exact top ngrams
+        approx = heavy_hitters((ngram for (i, ngram) in iter_ngrams(tokens, 3)), 10, width=4096)
+        assert set(n for (n, c) in approx[:5]) == set(n for (n, c) in exact.most_common(5))
+        assert heavy_hitters([1, 2, 3], 0) == []
+        print("Tests passed!")
+    except Exception as e:
+        print("Tests failed due to:", repr(e))
@@ -0,0 +1,229 @@
+"""
+This module implements timing instrumentation for corpus operations,
+recording per-stage wall time, call counts and memory deltas for each
+command, with an optional cProfile and tracemalloc capture of a single command
+
+https://docs.python.org/3/library/profile.html
+https://docs.python.org/3/library/tracemalloc.html
+
+@author: Connor Bechler
+@date: Fall, 2020
+"""
+
+import cProfile
+import ctypes
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+#Number of finished commands kept in the history
+HISTORY_LENGTH = 50
+
+_local = threading.local()
+_lock = threading.Lock()
+history = []
+totals = {}
+
+#Descriptor and page size for reading resident set size on Linux, opened once and read with pread so threads can share it
+try:
+    _statm = os.open('/proc/self/statm', os.O_RDONLY)
+    _page_size = os.sysconf('SC_PAGE_SIZE')
+except (OSError, ValueError, AttributeError):
+    _statm = None
+
+class _PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+    """Windows PROCESS_MEMORY_COUNTERS structure, used to read the working set size"""
+    _fields_ = [('cb', ctypes.c_ulong), ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+#Windows process handle and memory info function, where available
+try:
+    _kernel32 = ctypes.WinDLL('kernel32')
+    _kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+    _process = _kernel32.GetCurrentProcess()
+    _get_memory_info = _kernel32.K32GetProcessMemoryInfo
+    _get_memory_info.argtypes = [ctypes.c_void_p, ctypes.POINTER(_PROCESS_MEMORY_COUNTERS), ctypes.c_ulong]
+except (AttributeError, OSError):
+    _get_memory_info = None
+
+def _memory():
+    """Function returning the process' resident set size (working set on Windows) in bytes,
+    or None on platforms where it isn't available"""
+    if _statm is not None:
+        try:
+            return int(os.pread(_statm, 128, 0).split()[1]) * _page_size
+        except (OSError, ValueError, AttributeError):
+            return None
+    if _get_memory_info is not None:
+        counters = _PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        if _get_memory_info(_process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+def _traced():
+    """Function returning memory traced by tracemalloc in bytes, or None when it isn't running"""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    return None
+
+def _delta(start, end):
+    """Function returning the difference between two memory readings, or None if either is missing"""
+    if start is None or end is None:
+        return None
+    return end - start
+
+def _add(stats, name, elapsed, mem, traced):
+    """Function which adds one call of a stage to a stage statistics dictionary, keeping resident
+    set size deltas (mem) and tracemalloc deltas (traced) apart since they measure different things"""
+    entry = stats.setdefault(name, {'time': 0.0, 'calls': 0, 'mem': None, 'traced': None})
+    entry['time'] += elapsed
+    entry['calls'] += 1
+    if mem is not None:
+        entry['mem'] = (entry['mem'] or 0) + mem
+    if traced is not None:
+        entry['traced'] = (entry['traced'] or 0) + traced
+
+class CommandStats(object):
+    """Timing record of a single command and the stages run within it"""
+
+    def __init__(self, name):
+        """Initializes an empty record for the named command"""
+        self.name = name
+        self.date = datetime.now().isoformat()
+        self.time = 0.0
+        self.mem = None
+        self.traced = None
+        self.stages = {}
+        self.profile = None
+        self.allocations = None
+
+    def to_dict(self):
+        """Method returning the record as a JSON serializable dictionary"""
+        return {'command': self.name, 'date': self.date, 'time': self.time, 'mem': self.mem, 'traced': self.traced,
+                'stages': self.stages, 'profile': self.profile, 'allocations': self.allocations}
+
+def current_command():
+    """Function returning the command being recorded on the current thread, or None"""
+    return getattr(_local, 'command', None)
+
+@contextmanager
+def stage(name):
+    """Context manager recording the wall time and memory delta of a named stage;
+    nested stages are recorded by their full path, e.g. coll/alt_find_collocates/pmi scoring"""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(name)
+    path = '/'.join(stack)
+    command = current_command()
+    #Session totals drop the leading command keyword so the same stage is merged across commands, not across callers
+    total_key = '/'.join(stack[1:]) if (command is not None and len(stack) > 1) else path
+    mem_start = _memory()
+    traced_start = _traced()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        mem = _delta(mem_start, _memory())
+        traced = _delta(traced_start, _traced())
+        stack.pop()
+        if command is not None:
+            _add(command.stages, path, elapsed, mem, traced)
+        with _lock:
+            _add(totals, total_key, elapsed, mem, traced)
+
+def timed(name=None):
+    """Decorator recording every call of a function as a stage, named after the function by default"""
+    def decorator(func):
+        label = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def command(name, capture=False):
+    """Context manager recording a whole command into the history; if capture is True the command
+    also runs under cProfile and tracemalloc and the top functions and allocation sites are kept"""
+    record = CommandStats(name)
+    _local.command = record
+    profiler = None
+    if capture:
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        profiler.enable()
+    mem_start = _memory()
+    traced_start = _traced()
+    start = time.perf_counter()
+    try:
+        #Stage paths start with the command keyword rather than its full arguments
+        with stage(name.split(' ')[0]):
+            yield record
+    finally:
+        record.time = time.perf_counter() - start
+        record.mem = _delta(mem_start, _memory())
+        record.traced = _delta(traced_start, _traced())
+        if capture:
+            profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(25)
+            record.profile = out.getvalue()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            record.allocations = [str(s) for s in snapshot.statistics('lineno')[:10]]
+        _local.command = None
+        with _lock:
+            history.append(record)
+            del history[:-HISTORY_LENGTH]
+
+def format_stages(stages, pr=False):
+    """Function to properly format or print a dictionary of stage statistics, slowest first"""
+    output = '     Stage\t\t\t\t\t\t     Calls\t     Time (s)\t     RSS (MB)\t     Traced (MB)\n'
+    format_string = '{rank:<5}{stage:<56}{calls:<16}{time:<16}{mem:<16}{traced:<6}'
+    ranked = sorted(stages.items(), key=lambda x: x[1]['time'], reverse=True)
+    for i in range(len(ranked)):
+        mem = ranked[i][1]['mem']
+        traced = ranked[i][1]['traced']
+        output += format_string.format(rank=i+1, stage=ranked[i][0], calls=ranked[i][1]['calls'], time=round(ranked[i][1]['time'], 4),
+                                       mem='n/a' if mem is None else round(mem / 2**20, 2),
+                                       traced='n/a' if traced is None else round(traced / 2**20, 2)) + '\n'
+    if pr :
+        print(output)
+    else :
+        return output
+
+def format_command(record):
+    """Function returning a readable report of a command record, including any captured profile"""
+    output = record.name + ' | ' + str(round(record.time, 4)) + ' s\n' + format_stages(record.stages)
+    if record.profile is not None:
+        output += '\n' + record.profile
+    if record.allocations is not None:
+        output += '\nTop allocations:\n' + '\n'.join(record.allocations) + '\n'
+    return output
+
+def export_json(filename):
+    """Function which writes the command history and session totals to a JSON file"""
+    with _lock:
+        data = {'history': [r.to_dict() for r in history], 'totals': totals}
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
+
+def reset():
+    """Function which clears the command history and session totals"""
+    with _lock:
+        del history[:]
+        totals.clear()
@@ -9,6 +9,8 @@ using the NLTK and spaCy libraries
 import spacy
 from spacy import displacy
 import nltk
+from tasks import report
+from profiling import stage, timed
 
 nlp = spacy.load("en_core_web_sm")
 
@@ -28,13 +30,15 @@ sent3 = "Police and protesters clashed"
 
 #test = SyntaxFinder()
         
+@timed()
 def agency_parse(sents):
     """Command for collecting all of the subjects, processes, direct objects, and propositional objects into a dictionary"""
     agency_list = []
-    for sent in sents:
+    for i, sent in enumerate(sents):
         agency_out = {"sent": [], "subj": [], "process": [], "dobj": [], "propj": []}
         #output = sent + "\n"
-        parsed = nlp(sent)
+        with stage('spacy parser'):
+            parsed = nlp(sent)
         for token in parsed:
             agency_out["sent"].append(token.text)
             if token.dep_ == "nsubj":
@@ -46,10 +50,12 @@ def agency_parse(sents):
             elif token.dep_ == "propj":
                 agency_out["propj"].append(token.text)
         agency_list.append(agency_out)
+        report('Sentences parsed', i + 1, len(sents))
     return agency_list
 
         #displacy.serve(nlp(sent), style="dep")
 
+@timed()
 def analyze_agency(agency_list, keys):
     """Command for parsing lists of agency dictionaries"""
     output = ""
@@ -0,0 +1,159 @@
+"""
+This module implements background execution of long running commands,
+with throttled progress reporting and cooperative cancellation that
+corpus and syntax functions opt into by calling report() or check()
+
+@author: Connor Bechler
+@date: Fall, 2020
+"""
+
+import threading
+import time
+from collections import deque
+
+#Minimum number of seconds between printed progress updates
+REPORT_INTERVAL = 2
+
+_local = threading.local()
+_last_report = [0.0]
+
+class Cancelled(Exception):
+    """Exception raised inside a running command once it has been cancelled"""
+    pass
+
+class Task(object):
+    """A queued or running command, holding its cancellation flag and latest progress"""
+
+    def __init__(self, name, func, args=()):
+        """Initializes task with a display name and the function and arguments to run"""
+        self.name = name
+        self.func = func
+        self.args = args
+        self.progress = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Method which asks the task to stop at its next progress check"""
+        self._cancel.set()
+
+    def cancelled(self):
+        """Method which returns whether the task has been cancelled"""
+        return self._cancel.is_set()
+
+    def status(self):
+        """Method which returns a one line description of the task and its progress"""
+        if self.progress is None:
+            return self.name
+        label, cur, total = self.progress
+        return self.name + " | " + label + " " + str(cur) + " of " + str(total)
+
+def current_task():
+    """Function returning the task running on the current thread, or None outside a worker"""
+    return getattr(_local, 'task', None)
+
+def check():
+    """Function raising Cancelled if the task running on the current thread has been cancelled"""
+    task = current_task()
+    if task is not None and task.cancelled():
+        raise Cancelled(task.name + " cancelled")
+
+def report(label, cur, total):
+    """Function for reporting progress of a long running step, printing at most every REPORT_INTERVAL
+    seconds (and always on completion); also checks for cancellation when run in a worker"""
+    check()
+    task = current_task()
+    prefix = ""
+    if task is not None:
+        task.progress = (label, cur, total)
+        prefix = "[" + task.name + "] "
+    now = time.monotonic()
+    if cur >= total or now - _last_report[0] >= REPORT_INTERVAL:
+        _last_report[0] = now
+        print(prefix + label, cur, "of", total)
+
+def track(items, label, every=100000):
+    """Generator passing through a sized sequence while reporting progress (and checking for
+    cancellation) every so many items, for feeding long running library calls"""
+    total = len(items)
+    for i, item in enumerate(items):
+        if i % every == 0:
+            report(label, i, total)
+        yield item
+    report(label, total, total)
+
+class Worker(object):
+    """Background thread which runs submitted tasks one at a time in submission order"""
+
+    def __init__(self):
+        """Initializes and starts the worker thread"""
+        self.pending = deque()
+        self.running = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, name, func, *args):
+        """Method which queues func(*args) under a display name and returns its task"""
+        task = Task(name, func, args)
+        with self._cond:
+            self.pending.append(task)
+            self._cond.notify_all()
+        return task
+
+    def cancel(self, queued=False):
+        """Method which cancels the running task (and every queued task if queued is True)
+        and returns the list of cancelled tasks"""
+        cancelled = []
+        with self._cond:
+            if queued:
+                cancelled.extend(self.pending)
+                self.pending.clear()
+            if self.running is not None:
+                cancelled.insert(0, self.running)
+        for task in cancelled:
+            task.cancel()
+        return cancelled
+
+    def jobs(self):
+        """Method which returns the running task followed by the queued tasks"""
+        with self._cond:
+            return ([self.running] if self.running is not None else []) + list(self.pending)
+
+    def wait(self):
+        """Method which blocks until no task is running or queued"""
+        with self._cond:
+            while self.running is not None or self.pending:
+                self._cond.wait()
+
+    def close(self, timeout=None):
+        """Method which cancels all tasks and stops the worker thread, waiting at most timeout seconds
+        for a running task to reach its next cancellation check"""
+        self.cancel(queued=True)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        """Worker thread loop"""
+        while True:
+            with self._cond:
+                while not self.pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                task = self.pending.popleft()
+                self.running = task
+            _local.task = task
+            try:
+                check()
+                task.func(*task.args)
+            except Exception as e:
+                #Cancelled tasks land here too, printing which task was stopped
+                print(e)
+            finally:
+                _local.task = None
+                with self._cond:
+                    self.running = None
+                    self._cond.notify_all()